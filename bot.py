@@ -2,7 +2,14 @@
 # bot.py  — Telegram bot for RIF calls
 # =================================================================================================================
 
-import os, re, html, json, pickle, logging, datetime as dt, faiss, numpy as np
+import os
+# Pin BLAS/OpenMP pools to one thread before numpy/faiss load: single queries lose to pool overhead
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+
+import re, asyncio, logging, faiss, numpy as np
+import ahocorasick
+from concurrent.futures import ThreadPoolExecutor
 from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
@@ -11,28 +18,142 @@ from telegram.ext import (
     ContextTypes,
     filters,
 )
+import pyarrow.feather as feather
 from dotenv import load_dotenv
-from utils import embed_text, load_deadlines, load_missing_calls
+from utils import embed_query, load_deadlines, deadline_arrays, load_missing_calls
 
 # ─────────────────────────────────────────────────────────────────────────────
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
 # ── Load FAISS index + metadata ──────────────────────────────────────────────
+faiss.omp_set_num_threads(1)
+
+NPROBE    = 16     # IVF lists scanned per query
+EF_SEARCH = 32     # HNSW candidate list size per query
+
 try:
     index = faiss.read_index("index.faiss")
-    with open("meta.pkl", "rb") as mf:
-        meta = pickle.load(mf)
+    if (ivf := faiss.try_extract_index_ivf(index)) is not None:
+        ivf.nprobe = NPROBE
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = EF_SEARCH
+    # zero-copy: pages are mapped from meta.arrow, not decoded into Python objects
+    meta_tbl  = feather.read_table("meta.arrow", memory_map=True)
+    meta_text = meta_tbl.column("text")
+    meta_src  = meta_tbl.column("source")
     READY = True
 except Exception:
     log.warning("FAISS index not found – run ingest.py first.")
     READY = False
-    meta = []
+
+# One worker thread for the encoder: keeps embeds off the event loop, and the
+# HF fast tokenizer must not be driven from several threads at once
+_EMBED_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+# ── Search batcher: coalesce concurrent queries into one index.search ───────
+SEARCH_K   = 5
+BATCH_MAX  = 32        # max queries per index.search call
+BATCH_WAIT = 0.01      # seconds to let concurrent queries pile up
+CONCURRENT = BATCH_MAX # updates handled at once; without this PTB runs handlers one by one
+
+_SEARCH_Q: asyncio.Queue[tuple[np.ndarray, asyncio.Future]] = asyncio.Queue()
+_D = np.empty((BATCH_MAX, SEARCH_K), dtype=np.float32)   # reused result buffers
+_I = np.empty((BATCH_MAX, SEARCH_K), dtype=np.int64)
+
+OMP_BATCH = min(4, os.cpu_count() or 1)   # FAISS threads for multi-query batches
+
+
+def _search_into(batch: np.ndarray) -> None:
+    # only _search_worker calls this, one batch at a time, so the global OMP setting is ours
+    n = len(batch)
+    faiss.omp_set_num_threads(1 if n == 1 else OMP_BATCH)
+    index.search(batch, SEARCH_K, D=_D[:n], I=_I[:n])
+
+
+async def _search_worker() -> None:
+    """
+    Single consumer of _SEARCH_Q: waits BATCH_WAIT after the first query, stacks up
+    to BATCH_MAX pending vectors, searches them at once and resolves each future
+    with its own (scores, ids) row.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        pending = [await _SEARCH_Q.get()]
+        await asyncio.sleep(BATCH_WAIT)
+        while len(pending) < BATCH_MAX and not _SEARCH_Q.empty():
+            pending.append(_SEARCH_Q.get_nowait())
+
+        try:
+            await loop.run_in_executor(None, _search_into, np.vstack([v for v, _ in pending]))
+        except Exception as e:
+            log.exception("FAISS search failed")
+            for _, fut in pending:
+                if not fut.done():
+                    fut.set_exception(e)
+            continue
+
+        # copy rows out: the buffers are overwritten by the next batch
+        for j, (_, fut) in enumerate(pending):
+            if not fut.done():
+                fut.set_result((_D[j].copy(), _I[j].copy()))
+
+
+async def search(vec: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Queue a (1, DIM) query for the batcher; returns its (scores, ids), each of length SEARCH_K."""
+    fut = asyncio.get_running_loop().create_future()
+    await _SEARCH_Q.put((vec, fut))
+    return await fut
+
+
+_worker: asyncio.Task | None = None
+
+
+async def _post_init(app) -> None:
+    global _worker
+    _worker = asyncio.create_task(_search_worker())
+
+
+async def _post_shutdown(app) -> None:
+    if _worker:
+        _worker.cancel()
+
+
+# HTML escaping as one C-level str.translate (same output as html.escape(quote=True))
+_HTML_TBL = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#x27;"})
+
+# ── Prefilter: skip embed + search for messages with nothing to look up ──────
+TOKEN_RE  = re.compile(r"\w{3,}")
+STOPWORDS = {
+    "hello", "hey", "hiya", "thanks", "thank", "thx", "you", "bye", "good",
+    "morning", "evening", "night", "okay", "yes", "please", "cheers",
+    "γεια", "γειά", "σας", "ευχαριστώ", "καλημέρα", "καλησπέρα", "ναι", "οχι", "όχι",
+}
+
+HELP = (
+    "👋 Ask me about RIF calls, e.g.\n"
+    "• Show me all deadlines\n"
+    "• Which calls expire in June?\n"
+    "• Which calls expire in Dec?\n"
+    "• PRIMA budget"
+)
 
 # ── Load deadlines & missing-calls fallback ──────────────────────────────────
 DEADLINES = load_deadlines()       # expects data/merged_deadlines.json
 MISSINGS  = load_missing_calls()
 
+# Dated rows as date-sorted NumPy columns, filtered by month in fmt_deadlines
+_DL = deadline_arrays(DEADLINES)
+
+# Aho-Corasick automaton over all fallback programme names → one linear scan per message;
+# iter_long() so "erc fellowship" wins over its prefix "erc"
+MISSING_AC = None
+if MISSINGS:
+    MISSING_AC = ahocorasick.Automaton()
+    for key in MISSINGS:
+        MISSING_AC.add_word(key, key)
+    MISSING_AC.make_automaton()
+
 # ── Month name → number mapping (full and 3-letter) ──────────────────────────
 MONTH_ALIAS = {
     "jan": 1,    "january": 1,
@@ -48,21 +169,23 @@ MONTH_ALIAS = {
     "nov": 11,   "november": 11,
     "dec": 12,   "december": 12,
 }
+# letter neighbours block a match ("summary"), digits/punctuation don't ("15june", "jun2025")
+MONTH_RE = re.compile(
+    r"(?<![a-z])(" + "|".join(sorted(MONTH_ALIAS, key=len, reverse=True)) + r")(?![a-z])"
+)
 
-# ── Heuristic to detect deadline-style queries ────────────────────────────────
-DEADLINE_Q = re.compile(r"\b(deadline|expire|προθεσμ|λήξ[ei])", re.I)
+# ── Query-intent regex: one compiled pattern, one named group per branch ──────
+# (prefix match on purpose: deadline→deadlines, expire→expires, προθεσμ→προθεσμία)
+QUERY_RE = re.compile(r"(?P<deadline>\b(?:deadline|expire|προθεσμ|λήξ[ei]))")
 
 
-def extract_month_alias(text: str) -> str | None:
+def extract_month_alias(low: str) -> str | None:
     """
-    Look for any full or 3-letter month in the user’s query.
-    Returns the alias key (lower-case), or None.
+    Look for any full or 3-letter month in the (already lower-cased) user query.
+    Returns the alias key, or None.
     """
-    tl = text.lower()
-    for alias in MONTH_ALIAS:
-        if alias in tl:
-            return alias
-    return None
+    m = MONTH_RE.search(low)
+    return m.group(1) if m else None
 
 
 def fmt_deadlines(month_alias: str | None = None) -> str:
@@ -75,50 +198,32 @@ def fmt_deadlines(month_alias: str | None = None) -> str:
     # Determine the target month number, if any
     month_num = MONTH_ALIAS.get(month_alias) if month_alias else None
 
-    today = dt.date.today()
-    entries: list[tuple[dt.date, str, str]] = []
-
-    # Gather each code’s deadline
-    for row in DEADLINES:
-        try:
-            d = dt.datetime.strptime(row["deadline"], "%d %b %Y").date()
-        except ValueError:
-            continue
-        # If user asked for a specific month, filter
-        if month_num and d.month != month_num:
-            continue
-        entries.append((d, row["code"], row["status"]))
+    # Columns are pre-parsed and date-sorted at load time: filtering is one mask
+    sel = np.flatnonzero(_DL["month"] == month_num) if month_num else np.arange(len(_DL["date"]))
 
-    if not entries:
+    if not len(sel):
         return "No matching deadlines."
 
-    # Sort by date
-    entries.sort(key=lambda x: x[0])
-
     # Format each line
     lines = [
-        f"• <b>{html.escape(code)}</b> — {d.strftime('%d %b %Y')} <i>({status})</i>"
-        for d, code, status in entries
+        f"• <b>{code.translate(_HTML_TBL)}</b> — {label} <i>({status})</i>"
+        for code, label, status in zip(_DL["code"][sel], _DL["label"][sel], _DL["status"][sel])
     ]
     return "📅 <b>Deadlines</b>\n" + "\n".join(lines)
 
 
 async def start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "👋 Ask me about RIF calls, e.g.\n"
-        "• Show me all deadlines\n"
-        "• Which calls expire in June?\n"
-        "• Which calls expire in Dec?\n"
-        "• PRIMA budget"
-    )
+    await update.message.reply_text(HELP)
 
 
 async def handle(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     text = update.message.text.strip()
     low  = text.lower()
 
+    q = QUERY_RE.search(low)
+
     # 1️⃣ Deadline queries
-    if DEADLINE_Q.search(low):
+    if q and q.lastgroup == "deadline":
         m_alias = extract_month_alias(low)
         await update.message.reply_text(
             fmt_deadlines(m_alias),
@@ -127,33 +232,40 @@ async def handle(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         return
 
     # 2️⃣ Missing-programme fallback
-    for key, info in MISSINGS.items():
-        if key in low:
-            await update.message.reply_text(
-                f"ℹ️ <b>{html.escape(info['programme'])}</b>\n"
-                f"Deadline: {info['deadline']}\n"
-                f"Budget: {info['budget']}",
-                parse_mode="HTML"
-            )
-            return
+    if MISSING_AC and (hit := next(MISSING_AC.iter_long(low), None)):
+        info = MISSINGS[hit[1]]
+        await update.message.reply_text(
+            f"ℹ️ <b>{info['programme'].translate(_HTML_TBL)}</b>\n"
+            f"Deadline: {info['deadline']}\n"
+            f"Budget: {info['budget']}",
+            parse_mode="HTML"
+        )
+        return
 
     # 3️⃣ Semantic search in PDFs
     if not READY:
         await update.message.reply_text("Index not ready – run ingest.py first.")
         return
 
-    vec = embed_text(text)
-    D, I = index.search(vec, k=5)
+    # Greetings / one- and two-letter noise → help, without paying for embed + search
+    toks = set(TOKEN_RE.findall(low))
+    if not toks or toks <= STOPWORDS:
+        await update.message.reply_text(HELP)
+        return
+
+    # `low` is for the matchers only; the cased encoder gets the message as typed
+    vec = await asyncio.get_running_loop().run_in_executor(_EMBED_POOL, embed_query, text)
+    D, I = await search(vec)
     responses = []
-    for score, idx in zip(D[0], I[0]):
+    for score, idx in zip(D, I):
         if idx < 0 or score < 0.25:
             continue
-        chunk = meta[idx]["text"]
-        src   = meta[idx]["source"]
+        chunk = meta_text[idx].as_py()
+        src   = meta_src[idx].as_py()
         snippet = chunk[:350] + "…" if len(chunk) > 350 else chunk
         responses.append(
-            f"<blockquote>{html.escape(snippet)}</blockquote>\n"
-            f"<i>{html.escape(src)}</i>"
+            f"<blockquote>{snippet.translate(_HTML_TBL)}</blockquote>\n"
+            f"<i>{src.translate(_HTML_TBL)}</i>"
         )
 
     if responses:
@@ -167,7 +279,14 @@ def main() -> None:
     token = os.getenv("BOT_TOKEN")
     if not token:
         raise RuntimeError("Set BOT_TOKEN in your environment")
-    app = ApplicationBuilder().token(token).build()
+    app = (
+        ApplicationBuilder()
+        .token(token)
+        .concurrent_updates(CONCURRENT)      # the search batcher only coalesces concurrent handlers
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
     app.add_handler(CommandHandler("start", start))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle))
     app.run_polling()
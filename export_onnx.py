@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# export_onnx.py — one-off export of the MiniLM encoder to ONNX + dynamic INT8 quantisation
+# =================================================================================================================
+
+import pathlib, tempfile
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer
+
+MODEL_ID = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+ONNX_DIR = pathlib.Path(__file__).parent / "onnx"      # utils.py loads from here (git-ignored)
+
+with tempfile.TemporaryDirectory() as tmp:
+    # 1. export the PyTorch weights to ONNX (fp32) — only needed as quantiser input, so it stays in tmp
+    model = ORTModelForFeatureExtraction.from_pretrained(MODEL_ID, export=True)
+    model.save_pretrained(tmp)
+
+    # 2. dynamic INT8: weights quantised now, activations at run time (VNNI / AVX-512) → onnx/model_int8.onnx
+    quantizer = ORTQuantizer.from_pretrained(tmp)
+    quantizer.quantize(
+        save_dir=ONNX_DIR,
+        quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False),
+        file_suffix="int8",
+    )
+
+AutoTokenizer.from_pretrained(MODEL_ID).save_pretrained(ONNX_DIR)
+print(f"✅ exported → {ONNX_DIR}")
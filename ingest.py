@@ -3,8 +3,11 @@
 # =================================================================================================================
 
 from __future__ import annotations
-import pathlib, json, re, datetime as dt, requests, pickle, faiss, fitz, tqdm
+import os, pathlib, json, re, textwrap, datetime as dt, requests, faiss, fitz, tqdm
+import pyarrow as pa, pyarrow.feather as feather
 import dateparser, numpy as np, xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from blingfire import text_to_sentences
 from utils import embed_text
 
 # ─────────────────────────────────────────── CONSTANTS
@@ -17,12 +20,25 @@ PDF_JSON    = DATA_DIR / "pdf_deadlines.json"
 MERGED_JSON = DATA_DIR / "merged_deadlines.json"
 
 INDEX_F     = ROOT / "index.faiss"
-META_F      = ROOT / "meta.pkl"
+META_F      = ROOT / "meta.arrow"     # Arrow IPC, uncompressed → memory-mappable
 
-CHUNK_SZ    = 400
+CHUNK_SZ    = 400            # hard cap on chunk length (long sentences are wrapped to fit)
+CHUNK_MIN   = 300            # close a chunk once it reaches this many chars
+CHUNK_OVER  = 50             # chars of each chunk's tail repeated at the start of the next
 DIM         = 384
 WIN         = 300
 
+OCR_DPI     = 150            # first OCR pass
+OCR_DPI_HI  = 200            # retry when the first pass yields little text
+OCR_MIN_CH  = 100
+
+IVF_LISTS   = 256            # coarse centroids for IVF-PQ (HNSW_MAX ≥ 39 × this → enough training points)
+PQ_SPEC     = "PQ48x4fs"     # 48 sub-quantisers × 4 bit, SIMD FastScan layout
+TRAIN_MAX   = 50_000         # cap on the training sample
+HNSW_MAX    = 10_000         # below this many vectors: exact-vector HNSW, above: IVF-PQ
+HNSW_M      = 32             # graph degree for the HNSW index
+HNSW_EF_C   = 80             # efConstruction
+
 TODAY       = dt.date.today()
 THIS_YEAR   = TODAY.year
 
@@ -36,6 +52,22 @@ def iso_to_date(s: str | None) -> dt.date | None:
     except Exception:
         return None
 
+def build_index(mat: np.ndarray) -> faiss.Index:
+    """
+    HNSW (inner product, full vectors) up to HNSW_MAX vectors — today's PDF set;
+    IVF + 4-bit PQ FastScan beyond that, where memory and scan cost start to matter.
+    """
+    if len(mat) < HNSW_MAX:
+        index = faiss.IndexHNSWFlat(DIM, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_C
+    else:
+        index = faiss.index_factory(DIM, f"IVF{IVF_LISTS},{PQ_SPEC}", faiss.METRIC_INNER_PRODUCT)
+        rng   = np.random.default_rng(0)
+        pick  = rng.choice(len(mat), size=min(len(mat), TRAIN_MAX), replace=False)
+        index.train(mat[np.sort(pick)])
+    index.add(mat)
+    return index
+
 def fetch_budget(call_id: int) -> float | None:
     """
     If stub JSON didn’t have a budget, fetch the XML detail and pick the first <Budget> tag.
@@ -115,9 +147,7 @@ def scrape_api() -> list[dict]:
     print(f"✅ scraped {len(rows)} calls (≥{THIS_YEAR}) → {FRESH_JSON}")
     return rows
 
-fresh_rows = scrape_api()
-
-# ──────────────────────────────────────── 2. EXTRACT FROM PDFs (unchanged)
+# ──────────────────────────────────────── 2. EXTRACT FROM PDFs
 KW_RE    = re.compile(r"(deadline|προθεσμ|submission|closing date|λήξη)", re.I)
 DATE_RE  = re.compile(
     r"(?:\d{1,2}[./-]\d{1,2}[./-]20\d{2}|\d{1,2}\s+("
@@ -129,77 +159,134 @@ DATE_RE  = re.compile(
 )
 
 def ocr_page(pg: fitz.Page) -> str:
-   # pix = pg.get_pixmap(dpi=200)
-    global _ocr_count
-    _ocr_count += 1
-    pix = pg.get_pixmap(dpi=200)
     import PIL.Image, pytesseract
-    img = PIL.Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
-    return pytesseract.image_to_string(img, lang="ell+eng")
-
-pdf_rows, idx, meta = [], faiss.IndexFlatIP(DIM), []
-
-_ocr_count = 0
-
-for pdf in PDF_DIR.glob("*.pdf"):
+    for dpi in (OCR_DPI, OCR_DPI_HI):
+        pix = pg.get_pixmap(dpi=dpi)
+        img = PIL.Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        txt = pytesseract.image_to_string(img, lang="ell+eng")
+        if len(txt.strip()) >= OCR_MIN_CH:
+            break
+    return txt
+
+def chunk_text(txt: str) -> list[str]:
+    """
+    Greedy sentence packing: whole sentences are concatenated until a chunk holds
+    ≥ CHUNK_MIN chars; no chunk exceeds CHUNK_SZ. The chunk's last ~CHUNK_OVER chars,
+    cut on a word boundary, start the next chunk as overlap (dropped if they don't fit).
+    """
+    wrap  = CHUNK_SZ - CHUNK_OVER               # room for the carried tail
+    sents = []
+    for s in text_to_sentences(txt).split("\n"):
+        if s := s.strip():
+            sents.extend(textwrap.wrap(s, wrap) if len(s) > wrap else [s])
+
+    chunks, cur, size, fresh = [], [], 0, 0
+
+    def flush():
+        nonlocal cur, size, fresh
+        chunk = " ".join(cur)
+        chunks.append(chunk)
+        tail  = ""
+        if (start := len(chunk) - CHUNK_OVER) > 0:   # short chunks carry nothing
+            sp   = chunk.find(" ", start - 1)        # drop the partial word the cut lands in
+            tail = chunk[sp+1:] if sp != -1 else ""
+        cur, size, fresh = ([tail], len(tail) + 1, 0) if tail else ([], 0, 0)
+
+    for s in sents:
+        if size + len(s) > CHUNK_SZ:            # `size` already counts the joining space
+            if fresh:
+                flush()
+            if size + len(s) > CHUNK_SZ:        # tail + sentence still too long → no overlap
+                cur, size = [], 0
+        cur.append(s)
+        size  += len(s) + 1
+        fresh += 1
+        if size >= CHUNK_MIN:
+            flush()
+    if fresh:                                   # leftover that isn't just overlap
+        chunks.append(" ".join(cur))
+    return chunks
+
+def process_pdf(pdf: pathlib.Path) -> tuple[list[dict], list[str], int]:
+    """
+    Text extraction (OCR for pages without a text layer), deadline regexes and
+    chunking for one PDF. Runs in a worker process; returns
+    (deadline rows, chunks, number of OCR'd pages). Embedding happens in the parent.
+    """
     code = normalize_code(pdf.stem)
-    doc  = fitz.open(pdf)
-    txt  = "\n".join(
-        (t if (t:=pg.get_text("text").strip()) else ocr_page(pg))
-        for pg in tqdm.tqdm(doc, leave=False, desc=pdf.name)
-    )
+    pages, n_ocr = [], 0
+    for pg in fitz.open(pdf):
+        if not (t := pg.get_text("text").strip()):
+            t, n_ocr = ocr_page(pg), n_ocr + 1
+        pages.append(t)
+    txt = "\n".join(pages)
 
     found = {
         dateparser.parse(m.group(), languages=["en","el"], settings={"DATE_ORDER":"DMY"}).date()
         for km in KW_RE.finditer(txt)
         for m  in DATE_RE.finditer(txt[max(0,km.start()-WIN): km.end()+WIN])
     }
-    for d in sorted(found)[:2]:
-        pdf_rows.append({"code": code, "deadline": d.strftime("%d %b %Y")})
+    rows = [{"code": code, "deadline": d.strftime("%d %b %Y")} for d in sorted(found)[:2]]
+
+    return rows, chunk_text(txt), n_ocr
 
-    for i in range(0, len(txt), CHUNK_SZ):
-        chunk = txt[i:i+CHUNK_SZ].strip()
-        if chunk:
-            idx.add(embed_text(chunk))
-            meta.append({"text": chunk, "source": pdf.name})
+def extract_pdfs() -> list[dict]:
+    pdfs = sorted(PDF_DIR.glob("*.pdf"))
+    pdf_rows, vecs, texts, sources, ocr_count = [], [], [], [], 0
 
-PDF_JSON.write_text(json.dumps(pdf_rows, ensure_ascii=False, indent=2), "utf-8")
-faiss.write_index(idx, str(INDEX_F))
-with open(META_F, "wb") as mf:
-    pickle.dump(meta, mf)
-print(f"✅ extracted {len(pdf_rows)} PDF deadlines → {PDF_JSON}")
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        for pdf, (rows, chunks, n_ocr) in zip(pdfs, tqdm.tqdm(ex.map(process_pdf, pdfs), total=len(pdfs), desc="PDFs")):
+            pdf_rows.extend(rows)
+            ocr_count += n_ocr
+            if chunks:
+                vecs.append(embed_text(chunks))    # one batched forward pass per PDF
+                texts.extend(chunks)
+                sources.extend([pdf.name] * len(chunks))
 
-print(f"🔍 OCR was used on {_ocr_count} pages out of {sum(1 for _ in PDF_DIR.glob('*.pdf'))} PDF files.")
+    PDF_JSON.write_text(json.dumps(pdf_rows, ensure_ascii=False, indent=2), "utf-8")
+    idx = build_index(np.vstack(vecs) if vecs else np.empty((0, DIM), dtype=np.float32))
+    faiss.write_index(idx, str(INDEX_F))
+    feather.write_feather(pa.table({"text": texts, "source": sources}), META_F, compression="uncompressed")
+    print(f"✅ extracted {len(pdf_rows)} PDF deadlines → {PDF_JSON}")
+
+    print(f"🔍 OCR was used on {ocr_count} pages out of {len(pdfs)} PDF files.")
+    return pdf_rows
 
 # ──────────────────────────────────────── 3. MERGE (keep budget)
 def to_d(s: str) -> dt.date:
     return dt.datetime.strptime(s, "%d %b %Y").date()
 
-latest: dict[str, dt.date] = {}
-budgets: dict[str, float] = {}
-
-# seed PDF deadlines
-for r in pdf_rows:
-    latest[r["code"]] = to_d(r["deadline"])
-
-# override with API deadlines & capture budgets
-for r in fresh_rows:
-    c, d = r["code"], to_d(r["deadline"])
-    if (c not in latest) or (d > latest[c]):
-        latest[c] = d
-    if r.get("budget") is not None:
-        budgets[c] = r["budget"]
-
-# build final merged list
-merged = []
-for c, d in latest.items():
-    merged.append({
-        "code":     c,
-        "deadline": d.strftime("%d %b %Y"),
-        "status":   "OPEN" if d >= TODAY else "CLOSED",
-        "budget":   budgets.get(c),
-    })
-
-merged.sort(key=lambda x: to_d(x["deadline"]))
-MERGED_JSON.write_text(json.dumps(merged, ensure_ascii=False, indent=2), "utf-8")
-print(f"✅ merged → {MERGED_JSON} ({len(merged)} programmes)")
+def merge(pdf_rows: list[dict], fresh_rows: list[dict]) -> None:
+    latest: dict[str, dt.date] = {}
+    budgets: dict[str, float] = {}
+
+    # seed PDF deadlines
+    for r in pdf_rows:
+        latest[r["code"]] = to_d(r["deadline"])
+
+    # override with API deadlines & capture budgets
+    for r in fresh_rows:
+        c, d = r["code"], to_d(r["deadline"])
+        if (c not in latest) or (d > latest[c]):
+            latest[c] = d
+        if r.get("budget") is not None:
+            budgets[c] = r["budget"]
+
+    # build final merged list (sorted on the date objects we already hold)
+    merged = []
+    for c, d in sorted(latest.items(), key=lambda kv: kv[1]):
+        merged.append({
+            "code":     c,
+            "deadline": d.strftime("%d %b %Y"),
+            "status":   "OPEN" if d >= TODAY else "CLOSED",
+            "budget":   budgets.get(c),
+        })
+
+    MERGED_JSON.write_text(json.dumps(merged, ensure_ascii=False, indent=2), "utf-8")
+    print(f"✅ merged → {MERGED_JSON} ({len(merged)} programmes)")
+
+# ──────────────────────────────────────── MAIN
+# guarded so PDF worker processes can import this module without re-running the pipeline
+if __name__ == "__main__":
+    fresh_rows = scrape_api()
+    merge(extract_pdfs(), fresh_rows)
@@ -1,25 +1,68 @@
 # utils.py
 # ----------
-# • Sentence-transformers model (multilingual MiniLM)
-# • embed_text() returns a normalised vector for cosine search
-# • load_deadlines() returns a list[dict]
+# • Multilingual MiniLM, INT8-quantised ONNX export (see export_onnx.py), run on ONNX Runtime
+# • embed_text() returns normalised vectors (one row per input) for cosine search
+# • embed_query() is the LRU-cached single-query variant used by the bot
+# • load_deadlines() returns a date-sorted list[dict]; deadline_arrays() its dated rows as NumPy columns
 # • load_missing_calls() for the fallback list we already had
 # =================================================================================================================
 
-import json, numpy as np, datetime
-from sentence_transformers import SentenceTransformer
+import orjson, pathlib, functools, numpy as np, datetime, faiss
+import onnxruntime as ort
+from transformers import AutoTokenizer
 
-_MODEL = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+ONNX_DIR   = pathlib.Path(__file__).parent / "onnx"
+ONNX_MODEL = ONNX_DIR / "model_int8.onnx"
+MAX_LEN    = 128        # MiniLM's max_seq_length
+BATCH      = 64
 
-def embed_text(txt: str) -> np.ndarray:
-    vec = _MODEL.encode([txt])[0]
-    vec = vec / np.linalg.norm(vec)                # unit length  → cosine
-    return vec.astype("float32").reshape(1, -1)
+@functools.lru_cache(maxsize=1)
+def _model():
+    """Tokenizer + ONNX session, loaded on first use (ingest workers never pay for it)."""
+    sess = ort.InferenceSession(str(ONNX_MODEL), providers=["CPUExecutionProvider"])
+    return AutoTokenizer.from_pretrained(ONNX_DIR), sess, [i.name for i in sess.get_inputs()]
+
+def _encode(batch: list[str]) -> np.ndarray:
+    tok, sess, inputs = _model()
+    enc  = tok(batch, padding=True, truncation=True, max_length=MAX_LEN, return_tensors="np")
+    hid  = sess.run(None, {k: enc[k].astype(np.int64) for k in inputs})[0]
+    mask = enc["attention_mask"][..., None].astype(np.float32)
+    return (hid * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)   # mean pooling
+
+def embed_text(txt: str | list[str]) -> np.ndarray:
+    """
+    Encode one string or a whole batch (in BATCH-sized forward passes).
+    Returns an (N, 384) float32 C-contiguous array of unit-length rows (→ cosine).
+    """
+    batch = [txt] if isinstance(txt, str) else list(txt)
+    vecs  = np.ascontiguousarray(
+        np.vstack([_encode(batch[i:i+BATCH]) for i in range(0, len(batch), BATCH)]),
+        dtype=np.float32,
+    )
+    faiss.normalize_L2(vecs)            # one in-place SIMD pass over the whole (N, 384) buffer
+    return vecs
+
+@functools.lru_cache(maxsize=1024)
+def _embed_cached(txt: str) -> np.ndarray:
+    vec = embed_text(txt)
+    vec.flags.writeable = False         # shared by every cache hit: in-place edits would corrupt it
+    return vec
+
+def embed_query(txt: str) -> np.ndarray:
+    """
+    Cached (1, 384) embedding of a user query, so repeated questions cost no model time.
+    Case is kept: the XLM-R tokenizer is cased and PDF chunks are embedded as written
+    ("PRIMA" ≠ "prima"). The returned array is read-only (it is shared across cache hits).
+    """
+    return _embed_cached(txt.strip())
 
 def load_deadlines(path="data/merged_deadlines.json"):
-    """Loads raw JSON and always returns list of {code,deadline,status}."""
+    """
+    Loads raw JSON and always returns list of {code,deadline,status,_date},
+    sorted by date. `_date` is the parsed deadline (None if unparseable).
+    """
     try:
-        raw = json.load(open(path, encoding="utf-8"))
+        raw = orjson.loads(pathlib.Path(path).read_bytes())
     except FileNotFoundError:
         return []
 
@@ -31,21 +74,37 @@ def load_deadlines(path="data/merged_deadlines.json"):
         if not code or not dl:
             continue
 
+        try:
+            dt_obj = datetime.datetime.strptime(dl, "%d %b %Y").date()
+        except ValueError:
+            dt_obj = None
+
         status = d.get("status")
         if status not in ("OPEN", "CLOSED"):
-            try:
-                dt_obj = datetime.datetime.strptime(dl, "%d %b %Y").date()
-                status = "OPEN" if dt_obj >= today else "CLOSED"
-            except ValueError:
-                status = "OPEN"
+            status = "OPEN" if dt_obj is None or dt_obj >= today else "CLOSED"
 
-        out.append({"code":code, "deadline":dl, "status":status})
+        out.append({"code":code, "deadline":dl, "status":status, "_date":dt_obj})
+    out.sort(key=lambda r: r["_date"] or datetime.date.max)
     return out
 
+def deadline_arrays(rows: list[dict]) -> dict[str, np.ndarray]:
+    """
+    Dated rows of load_deadlines() as parallel columns (order kept):
+    code, status, label ("%d %b %Y"), date (datetime64[D]) and month (1-12).
+    """
+    dated = [r for r in rows if r["_date"]]
+    dates = np.array([r["_date"] for r in dated], dtype="datetime64[D]")
+    return {
+        "code":   np.array([r["code"] for r in dated], dtype=object),
+        "status": np.array([r["status"] for r in dated], dtype=object),
+        "label":  np.array([r["_date"].strftime("%d %b %Y") for r in dated], dtype=object),
+        "date":   dates,
+        "month":  dates.astype("datetime64[M]").astype(int) % 12 + 1,
+    }
+
 def load_missing_calls(path="missing_calls.json"):
     try:
-        with open(path, encoding="utf-8") as f:
-            data = json.load(f)
+        data = orjson.loads(pathlib.Path(path).read_bytes())
         return {d["programme"].lower(): d for d in data}
     except FileNotFoundError:
         return {}